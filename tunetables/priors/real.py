@@ -1,3 +1,4 @@
+from functools import lru_cache
 import gzip
 import json
 from pathlib import Path
@@ -8,9 +9,12 @@ import warnings
 try:
     import faiss
 except ImportError:
+    faiss = None
     print("faiss is not available; subset maker will not work until it is installed")
 
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, TransformerMixin, clone
 from sklearn.preprocessing import LabelEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.compose import ColumnTransformer
@@ -37,6 +41,102 @@ try:
 except ImportError:
     print("umap is not available; subset maker umap will not work until it is installed")
 
+@lru_cache(maxsize=None)
+def _coreset_step():
+    """compile the numba coreset kernel on first use, so that importing this module does not import numba; None
+    when numba is not installed"""
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def coreset_step(features, anchor, min_dist):
+        """Fused distance-to-anchor, running-min update and argmax over the rows of features."""
+        N, D = features.shape
+        for i in numba.prange(N):
+            acc = 0.0
+            for j in range(D):
+                t = features[i, j] - anchor[j]
+                acc += t * t
+            if acc < min_dist[i]:
+                min_dist[i] = acc
+        return np.argmax(min_dist)
+
+    return coreset_step
+
+try:
+    from numcodecs import Blosc
+except ImportError:
+    Blosc = None
+
+# metadata (de)serialization; orjson is used when available
+try:
+    import orjson
+
+    def _json_loads(b):
+        return orjson.loads(b)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    def _json_loads(b):
+        return json.loads(b)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=4).encode()
+
+# buffer size for the compressed dataset files read and written by TabularDataset
+GZIP_BUFFER_SIZE = 1 << 20
+# uncompressed bytes per blosc frame (blosc cannot encode more than 2 GiB at once)
+BLOSC_FRAME_SIZE = 1 << 28
+
+def write_compressed(p: Path, arr: np.ndarray) -> None:
+    """write arr to p; *.npy.blosc files hold blosc/zstd frames, anything else is a gzipped .npy"""
+    if not p.name.endswith(".npy.blosc"):
+        with open(p, "wb", buffering=GZIP_BUFFER_SIZE) as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            np.save(f, arr)
+        return
+    if Blosc is None:
+        raise ImportError("numcodecs is required to write .npy.blosc files")
+    if arr.dtype.hasobject:
+        raise ValueError("object arrays cannot be written as .npy.blosc, use .npy.gz instead")
+    codec = Blosc(cname="zstd", clevel=3, shuffle=Blosc.BITSHUFFLE)
+    # frames are cut along the flattened array so blosc shuffles with the element size
+    flat = np.ascontiguousarray(arr).reshape(-1)
+    step = max(BLOSC_FRAME_SIZE // max(arr.dtype.itemsize, 1), 1)
+    frames = [codec.encode(flat[i:i + step]) for i in range(0, max(flat.size, 1), step)]
+    header = json.dumps({
+        "dtype": arr.dtype.str,
+        "shape": arr.shape,
+        "frame_items": step,
+        "frames": [len(frame) for frame in frames],
+    }).encode()
+    with open(p, "wb") as f:
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        for frame in frames:
+            f.write(frame)
+
+def read_compressed(p: Path, allow_pickle=False) -> np.ndarray:
+    """read an array written by write_compressed, dispatching on the file suffix"""
+    if not p.name.endswith(".npy.blosc"):
+        with open(p, "rb", buffering=GZIP_BUFFER_SIZE) as raw, gzip.GzipFile(fileobj=raw, mode="rb") as f:
+            return np.load(f, allow_pickle=allow_pickle)
+    if Blosc is None:
+        raise ImportError(f"numcodecs is required to read {p}")
+    codec = Blosc()
+    with open(p, "rb") as f:
+        header = json.loads(f.read(int.from_bytes(f.read(4), "little")))
+        out = np.empty(int(np.prod(header["shape"])), dtype=np.dtype(header["dtype"]))
+        step = header["frame_items"]
+        # decode every frame straight into its slice of the output
+        for i, frame_len in zip(range(0, max(out.size, 1), step), header["frames"]):
+            frame = f.read(frame_len)
+            if out.size:
+                codec.decode(frame, out=out[i:i + step])
+    return out.reshape(header["shape"])
+
 class TabDS(Dataset):
     def __init__(self, X, y):
         #check if NaNs are present in y
@@ -48,13 +148,14 @@ class TabDS(Dataset):
             print("New X shape: ", X.shape)
             print("New y shape: ", y.shape)
 
+        # at most one copy per array: ascontiguousarray only copies when the dtype or layout has to change
         if isinstance(X, np.ndarray):
-            self.X = torch.from_numpy(X.copy().astype(np.float32))
+            self.X = torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32))
         else:
             self.X = X
 
-        self.y_float = torch.from_numpy(y.copy().astype(np.float32))
-        self.y = torch.from_numpy(y.copy().astype(np.int64))
+        self.y_float = torch.from_numpy(np.ascontiguousarray(y, dtype=np.float32))
+        self.y = self.y_float.to(torch.int64)
 
         print(f"TabDS: X.shape = {self.X.shape}, y.shape = {self.y.shape}")
 
@@ -143,8 +244,44 @@ class TabularDataset(object):
         self.split_indeces = split_indeces
         self.split_source = split_source
 
+        # feature-type masks used by process_data, computed on first access
+        self._num_mask = None
+        self._num_idx = None
+        self._perm_idx = None
+        # unfitted imputation pipeline, cloned by process_data for every split
+        self._preprocessor_template = None
+
         pass
 
+    @property
+    def num_mask(self) -> np.ndarray:
+        """1 for numerical features and 0 for categorical features"""
+        if self._num_mask is None:
+            num_mask = np.ones(self.num_features, dtype=int)
+            num_mask[self.cat_idx] = 0
+            self._num_mask = num_mask
+        return self._num_mask
+
+    @property
+    def num_idx(self) -> np.ndarray:
+        """indices of the numerical features"""
+        if self._num_idx is None:
+            self._num_idx = np.where(self.num_mask)[0]
+        return self._num_idx
+
+    @property
+    def perm_idx(self) -> np.ndarray:
+        """column permutation restoring the original feature order after a ColumnTransformer has put the numerical
+        features first and the categorical features after them"""
+        if self._perm_idx is None:
+            cat_positions = np.where(self.num_mask == 0)[0]
+            assert len(cat_positions) == len(self.cat_idx)
+            perm_idx = np.empty(self.num_features, dtype=np.intp)
+            perm_idx[self.num_idx] = np.arange(len(self.num_idx))
+            perm_idx[cat_positions] = np.arange(len(self.num_idx), self.num_features)
+            self._perm_idx = perm_idx
+        return self._perm_idx
+
     def target_encode(self):
         # print("target_encode...")
         le = LabelEncoder()
@@ -164,14 +301,23 @@ class TabularDataset(object):
             )
         self.cat_dims = []
 
-        # Preprocess data
+        # Preprocess data; for numeric columns np.unique gives the same sorted codes as LabelEncoder in a single
+        # C-level sort. Object columns (e.g. strings mixed with NaN) need LabelEncoder's handling of mixed types and NaN.
+        cat_idx = set(self.cat_idx or [])
         for i in range(self.num_features):
-            if self.cat_idx and i in self.cat_idx:
-                le = LabelEncoder()
-                self.X[:, i] = le.fit_transform(self.X[:, i])
+            if i in cat_idx:
+                col = np.asarray(self.X[:, i])
+                if col.dtype == object:
+                    le = LabelEncoder()
+                    self.X[:, i] = le.fit_transform(col)
+                    n_categories = len(le.classes_)
+                else:
+                    uniq, inv = np.unique(col, return_inverse=True)
+                    self.X[:, i] = inv
+                    n_categories = len(uniq)
 
                 # Setting this?
-                self.cat_dims.append(len(le.classes_))
+                self.cat_dims.append(n_categories)
 
     def get_metadata(self) -> dict:
         return {
@@ -186,12 +332,16 @@ class TabularDataset(object):
         }
 
     @classmethod
-    def read(cls, p: Path):
-        """read a dataset from a folder"""
+    def read(cls, p: Path, mmap=False):
+        """read a dataset from a folder
+
+        mmap: if True and an uncompressed X.npy / y.npy exists (see decompress_cache), memory-map it instead of
+            decompressing the whole array into RAM. rows are then only loaded when they are indexed.
+        """
 
-        # make sure that all required files exist in the directory
-        X_path = p.joinpath("X.npy.gz")
-        y_path = p.joinpath("y.npy.gz")
+        # make sure that all required files exist in the directory; X and y may be stored as blosc or gzip
+        X_path = cls._array_path(p, "X", mmap=mmap)
+        y_path = cls._array_path(p, "y", mmap=mmap)
         metadata_path = p.joinpath("metadata.json")
         split_indeces_path = p / "split_indeces.npy.gz"
 
@@ -204,23 +354,54 @@ class TabularDataset(object):
             split_indeces_path.exists()
         ), f"path to split indeces does not exist: {split_indeces_path}"
 
-        # read data
-        with gzip.GzipFile(X_path, "r") as f:
-            X = np.load(f, allow_pickle=True)
-        with gzip.GzipFile(y_path, "r") as f:
-            y = np.load(f)
-        with gzip.GzipFile(split_indeces_path, "rb") as f:
-            split_indeces = np.load(f, allow_pickle=True)
+        # read data; memory-maps are copy-on-write so in-place encoding never touches the cached file
+        if X_path.name.endswith(".npy.gz") or X_path.name.endswith(".npy.blosc"):
+            X = read_compressed(X_path, allow_pickle=True)
+        else:
+            X = np.load(X_path, mmap_mode="c")
+        if y_path.name.endswith(".npy.gz") or y_path.name.endswith(".npy.blosc"):
+            y = read_compressed(y_path)
+        else:
+            y = np.load(y_path, mmap_mode="c")
+        split_indeces = read_compressed(split_indeces_path, allow_pickle=True)
 
         # read metadata
-        with open(metadata_path, "r") as f:
-            kwargs = json.load(f)
+        with open(metadata_path, "rb") as f:
+            kwargs = _json_loads(f.read())
 
         kwargs["X"], kwargs["y"], kwargs["split_indeces"] = X, y, split_indeces
         return cls(**kwargs)
 
-    def write(self, p: Path, overwrite=False) -> None:
-        """write the dataset to a new folder. this folder cannot already exist"""
+    @classmethod
+    def decompress_cache(cls, p: Path) -> None:
+        """write uncompressed X.npy and y.npy next to the compressed arrays so that read(p, mmap=True) can
+        memory-map them. object arrays cannot be memory-mapped and are skipped."""
+        for name in ["X", "y"]:
+            arr = read_compressed(cls._array_path(p, name), allow_pickle=True)
+            if arr.dtype.hasobject:
+                print(f"{name} has dtype object and cannot be memory-mapped, not caching it")
+                continue
+            np.save(p / f"{name}.npy", arr)
+
+    @staticmethod
+    def _array_path(p: Path, name: str, mmap=False) -> Path:
+        """prefer an uncompressed {name}.npy when mmap is set, then {name}.npy.blosc when it exists, else {name}.npy.gz.
+        without numcodecs, reading the .npy.blosc path raises an ImportError"""
+        npy_path = p / f"{name}.npy"
+        if mmap and npy_path.exists():
+            return npy_path
+        blosc_path = p / f"{name}.npy.blosc"
+        if blosc_path.exists():
+            return blosc_path
+        return p / f"{name}.npy.gz"
+
+    def write(self, p: Path, overwrite=False, compression="gzip") -> None:
+        """write the dataset to a new folder. this folder cannot already exist
+
+        compression: "gzip" or "blosc". blosc (zstd, requires numcodecs) is much faster to read and write and is
+            used for X and y; object arrays and the split indeces are always written with gzip.
+        """
+        assert compression in ["gzip", "blosc"], f"compression not recognized: {compression}"
 
         if not overwrite:
             assert ~p.exists(), f"the path {p} already exists."
@@ -229,17 +410,19 @@ class TabularDataset(object):
         p.mkdir(parents=True, exist_ok=overwrite)
 
         # write data
-        with gzip.GzipFile(p.joinpath("X.npy.gz"), "w") as f:
-            np.save(f, self.X)
-        with gzip.GzipFile(p.joinpath("y.npy.gz"), "w") as f:
-            np.save(f, self.y)
-        with gzip.GzipFile(p.joinpath("split_indeces.npy.gz"), "wb") as f:
-            np.save(f, self.split_indeces)
+        for name, arr in [("X", self.X), ("y", self.y)]:
+            suffix = ".npy.blosc" if compression == "blosc" and not arr.dtype.hasobject else ".npy.gz"
+            write_compressed(p / f"{name}{suffix}", arr)
+            # remove a copy in the other format so that read does not pick up stale data
+            stale_paths = [p / f"{name}{'.npy.gz' if suffix == '.npy.blosc' else '.npy.blosc'}", p / f"{name}.npy"]
+            for stale_path in stale_paths:
+                if stale_path.exists():
+                    stale_path.unlink()
+        write_compressed(p / "split_indeces.npy.gz", self.split_indeces)
 
         # write metadata
-        with open(p.joinpath("metadata.json"), "w") as f:
-            metadata = self.get_metadata()
-            json.dump(self.get_metadata(), f, indent=4)
+        with open(p.joinpath("metadata.json"), "wb") as f:
+            f.write(_json_dumps(self.get_metadata()))
 
 
 
@@ -250,35 +433,50 @@ class CoresetSampler:
         self.rng = np.random.default_rng(rand_seed)
 
     def _compute_batchwise_differences(self, a, b):
-        return np.sum((a[:, None] - b) ** 2, axis=-1)
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b^T, a single SGEMM instead of an (N, M, D) temporary
+        a32 = np.ascontiguousarray(a, dtype=np.float32)
+        b32 = np.ascontiguousarray(b, dtype=np.float32)
+        aa = (a32 * a32).sum(1)[:, None]
+        bb = (b32 * b32).sum(1)[None, :]
+        # clip the small negative values left by cancellation
+        return np.maximum(aa + bb - 2.0 * (a32 @ b32.T), 0.0)
 
     def _compute_greedy_coreset_indices(self, features):
         number_of_starting_points = np.clip(
             self.number_of_starting_points, None, len(features)
         )
         start_points = self.rng.choice(len(features), number_of_starting_points, replace=False).tolist()
-        approximate_distance_matrix = self._compute_batchwise_differences(
-            features, features[start_points]
-        )
-        approximate_coreset_anchor_distances = np.mean(
-            approximate_distance_matrix, axis=-1
-        ).reshape(-1, 1)
-        coreset_indices = []
-        num_coreset_samples = self.number_of_set_points
-
+        # Contiguous float32 so the matrix-vector products below dispatch to SGEMV
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        # Running distance of every point to its nearest selected point, updated in place; starts as the distance to
+        # the nearest starting point
+        if faiss is not None:
+            index = faiss.IndexFlatL2(features.shape[1])
+            index.add(features[start_points])
+            min_dist, _ = index.search(features, 1)
+            min_dist = np.ascontiguousarray(min_dist[:, 0])
+        else:
+            min_dist = self._compute_batchwise_differences(features, features[start_points]).min(axis=-1)
+        # the starting points are at distance 0 from themselves, i.e. already selected: they lead the coreset
+        coreset_indices = start_points[:self.number_of_set_points]
+        num_coreset_samples = self.number_of_set_points - len(coreset_indices)
+
+        select_idx = int(min_dist.argmax())
+        coreset_step = _coreset_step()
+        if coreset_step is None:
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b, with ||a||^2 computed once
+            feat_sq = np.einsum("ij,ij->i", features, features)
         for _ in range(num_coreset_samples):
-            select_idx = np.argmax(approximate_coreset_anchor_distances)
             coreset_indices.append(select_idx)
-            coreset_select_distance = self._compute_batchwise_differences(
-                features, features[select_idx : select_idx + 1]
+            if coreset_step is not None:
+                # single pass over features per pick
+                select_idx = int(coreset_step(features, features[select_idx], min_dist))
+                continue
+            coreset_select_distance = (
+                feat_sq + feat_sq[select_idx] - 2 * np.dot(features, features[select_idx])
             )
-            approximate_coreset_anchor_distances = np.concatenate(
-                [approximate_coreset_anchor_distances, coreset_select_distance],
-                axis=-1,
-            )
-            approximate_coreset_anchor_distances = np.min(
-                approximate_coreset_anchor_distances, axis=1
-            ).reshape(-1, 1)
+            np.minimum(min_dist, coreset_select_distance, out=min_dist)
+            select_idx = int(min_dist.argmax())
 
         return np.array(coreset_indices)
 
@@ -299,13 +497,16 @@ class SubsetMaker(object):
         self.seed = seed
 
     def random_subset(self, X, y, action=[]):
+        # seeded from the global RNG so that the subsets follow seed_all / np.random.seed like the rest of the pipeline
+        rng = np.random.default_rng(np.random.randint(np.iinfo(np.int32).max))
         if "rows" in action:
-            row_indices = np.random.choice(X.shape[0], self.subset_rows, replace=False)
+            # Generator.choice samples without permuting all N rows; shuffle=False also skips reordering the sample
+            row_indices = rng.choice(X.shape[0], min(self.subset_rows, X.shape[0]), replace=False, shuffle=False)
         else:
             row_indices = np.arange(X.shape[0])
         if "features" in action:
-            feature_indices = np.random.choice(
-                X.shape[1], self.subset_features, replace=False
+            feature_indices = rng.choice(
+                X.shape[1], min(self.subset_features, X.shape[1]), replace=False, shuffle=False
             )
         else:
             feature_indices = np.arange(X.shape[1])
@@ -370,13 +571,15 @@ class SubsetMaker(object):
                 X = X[:first_only_num]
             #start the timer
             timer = time.time()
-            self.kmeans = faiss.Kmeans(X.shape[1], self.subset_rows, niter=15+addl_steps, verbose=False)
+            # train on all visible GPUs when this faiss build has GPU support
+            use_gpu = faiss.get_num_gpus() > 0
+            self.kmeans = faiss.Kmeans(X.shape[1], self.subset_rows, niter=15+addl_steps, verbose=False, gpu=use_gpu)
             self.kmeans.train(X)
             print(f"Done fitting kmeans in {round(time.time() - timer, 1)} seconds")
-            cluster_centers = self.kmeans.centroids
+            # index the rows and look up the one nearest to each centroid
             index = faiss.IndexFlatL2(X.shape[1])
-            index.add(cluster_centers)
-            _, indices = index.search(cluster_centers, 1)
+            index.add(X)
+            _, indices = index.search(self.kmeans.centroids, 1)
             indices = indices.reshape(-1)
             return X[indices], y[indices]
         else:
@@ -639,6 +842,45 @@ def data_prep(X, y):
 def get_shuffle_index(X):
     return np.random.permutation(X.shape[0])
 
+class MeanImputer(BaseEstimator, TransformerMixin):
+    """replaces NaNs with the column means seen in fit; a vectorized SimpleImputer(strategy="mean") for dense arrays.
+    unlike SimpleImputer, fully NaN columns are not dropped, so they should be handled before fitting"""
+
+    @staticmethod
+    def _as_float(X):
+        X = np.asarray(X)
+        dtype = X.dtype if X.dtype in (np.float32, np.float64) else np.float64
+        return np.array(X, dtype=dtype)
+
+    def fit(self, X, y=None):
+        self.statistics_ = np.nanmean(self._as_float(X), axis=0)
+        return self
+
+    def transform(self, X):
+        X = self._as_float(X)
+        nan_rows, nan_cols = np.where(np.isnan(X))
+        X[nan_rows, nan_cols] = self.statistics_[nan_cols]
+        return X
+
+
+def _make_preprocessor(dataset):
+    """build the unfitted imputation pipeline for a dataset"""
+    if len(dataset.cat_idx) == 0:
+        # All features are numerical: the ColumnTransformer and the column re-ordering are no-ops
+        return MeanImputer()
+    # Impute numerical and categorical features
+    numeric_transformer = Pipeline(steps=[("imputer", MeanImputer())])
+    categorical_transformer = Pipeline(steps=[("imputer", SimpleImputer(strategy="most_frequent"))])
+    return ColumnTransformer(
+        transformers=[
+            ("num", numeric_transformer, dataset.num_idx),
+            # ("pass", "passthrough", dataset.cat_idx),
+            ("cat", categorical_transformer, dataset.cat_idx),
+        ],
+        # remainder="passthrough",
+    )
+
+
 def process_data(
     dataset,
     train_index,
@@ -660,56 +902,40 @@ def process_data(
 
     print("Do impute: ", impute)
 
-    num_mask = np.ones(dataset.X.shape[1], dtype=int)
-    num_mask[dataset.cat_idx] = 0
+    num_mask = dataset.num_mask
 
     # Impute numerical features
     if impute:
-        num_idx = np.where(num_mask)[0]
+        num_idx = dataset.num_idx
 
         # The imputer drops columns that are fully NaN. So, we first identify columns that are fully NaN and set them to
         # zero. This will effectively drop the columns without changing the column indexing and ordering that many of
         # the functions in this repository rely upon.
-        fully_nan_num_idcs = np.nonzero(
-            (~np.isnan(X_train[:, num_idx].astype("float"))).sum(axis=0) == 0
-        )[0]
+        num_block = X_train[:, num_idx]
+        if num_block.dtype != np.float32 and num_block.dtype != np.float64:
+            num_block = num_block.astype(np.float32)
+        fully_nan_num_idcs = np.where(np.isnan(num_block).all(axis=0))[0]
         if fully_nan_num_idcs.size > 0:
             print(f"Fully NaN numerical features: {fully_nan_num_idcs}")
-            X_train[:, num_idx[fully_nan_num_idcs]] = 0
-            X_val[:, num_idx[fully_nan_num_idcs]] = 0
-            X_test[:, num_idx[fully_nan_num_idcs]] = 0
-
-        # Impute numerical and categorical features
-        numeric_transformer = Pipeline(steps=[("imputer", SimpleImputer(strategy="mean"))])
-        categorical_transformer = Pipeline(steps=[("imputer", SimpleImputer(strategy="most_frequent"))])
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ("num", numeric_transformer, num_idx),
-                # ("pass", "passthrough", dataset.cat_idx),
-                ("cat", categorical_transformer, dataset.cat_idx),
-            ],
-            # remainder="passthrough",
-        )
+            fully_nan_cols = num_idx[fully_nan_num_idcs]
+            for X_split in (X_train, X_val, X_test):
+                X_split[:, fully_nan_cols] = 0
+
+        if dataset._preprocessor_template is None:
+            dataset._preprocessor_template = _make_preprocessor(dataset)
+        preprocessor = clone(dataset._preprocessor_template)
         X_train = preprocessor.fit_transform(X_train)
-        X_val = preprocessor.transform(X_val)
-        X_test = preprocessor.transform(X_test)
-
-        # Re-order columns (ColumnTransformer permutes them)
-        perm_idx = []
-        running_num_idx = 0
-        running_cat_idx = 0
-        for is_num in num_mask:
-            if is_num > 0:
-                perm_idx.append(running_num_idx)
-                running_num_idx += 1
-            else:
-                perm_idx.append(running_cat_idx + len(num_idx))
-                running_cat_idx += 1
-        assert running_num_idx == len(num_idx)
-        assert running_cat_idx == len(dataset.cat_idx)
-        X_train = X_train[:, perm_idx]
-        X_val = X_val[:, perm_idx]
-        X_test = X_test[:, perm_idx]
+        # val and test are transformed independently; the numpy kernels release the GIL
+        X_val, X_test = Parallel(n_jobs=2, prefer="threads")(
+            delayed(preprocessor.transform)(X) for X in (X_val, X_test)
+        )
+
+        if len(dataset.cat_idx) > 0:
+            # Re-order columns (ColumnTransformer permutes them)
+            perm_idx = dataset.perm_idx
+            X_train = X_train[:, perm_idx]
+            X_val = X_val[:, perm_idx]
+            X_test = X_test[:, perm_idx]
 
     if scaler != "None":
         if verbose:
@@ -722,9 +948,10 @@ def process_data(
         ohe = OneHotEncoder(sparse=False, handle_unknown="ignore")
         new_x1 = ohe.fit_transform(X_train[:, dataset.cat_idx])
         X_train = np.concatenate([new_x1, X_train[:, num_mask]], axis=1)
-        new_x1_test = ohe.transform(X_test[:, dataset.cat_idx])
+        new_x1_val, new_x1_test = Parallel(n_jobs=2, prefer="threads")(
+            delayed(ohe.transform)(X[:, dataset.cat_idx]) for X in (X_val, X_test)
+        )
         X_test = np.concatenate([new_x1_test, X_test[:, num_mask]], axis=1)
-        new_x1_val = ohe.transform(X_val[:, dataset.cat_idx])
         X_val = np.concatenate([new_x1_val, X_val[:, num_mask]], axis=1)
         if verbose:
             print("New Shape:", X_train.shape)
@@ -851,15 +1078,26 @@ def preprocess_input(eval_xs, preprocess_transform, summerize_after_prep, args,
     warnings.simplefilter('error')
     if preprocess_transform != 'none':
         eval_xs = eval_xs.cpu().numpy()
-        feats = set(range(eval_xs.shape[1]))
-        for col in feats:
-            try:
-                pt.fit(eval_xs[0:eval_position, col:col + 1])
-                trans = pt.transform(eval_xs[:, col:col + 1])
-                eval_xs[:, col:col + 1] = trans
-            except:
-                pass
-        eval_xs = torch.tensor(eval_xs).float()
+        # the transforms work per column and tolerate NaNs, but columns that contain +-inf or are entirely NaN
+        # cannot be fitted and are left untransformed
+        fit_xs = eval_xs[0:eval_position]
+        feats = np.where(~(np.isinf(eval_xs).any(axis=0) | np.isnan(fit_xs).all(axis=0)))[0]
+        try:
+            # a single call fits all columns at once
+            pt.fit(fit_xs[:, feats])
+            eval_xs[:, feats] = pt.transform(eval_xs[:, feats])
+        except:
+            # some column failed (warnings are errors here): transform column by column, skipping failures.
+            # column-major so that every eval_xs[:, col:col + 1] below is a contiguous slice
+            eval_xs = np.asfortranarray(eval_xs)
+            for col in feats:
+                try:
+                    pt.fit(eval_xs[0:eval_position, col:col + 1])
+                    trans = pt.transform(eval_xs[:, col:col + 1])
+                    eval_xs[:, col:col + 1] = trans
+                except:
+                    pass
+        eval_xs = torch.tensor(np.ascontiguousarray(eval_xs)).float()
     warnings.simplefilter('default')
 
     eval_xs = eval_xs.unsqueeze(1)
@@ -880,23 +1118,32 @@ def preprocess_input(eval_xs, preprocess_transform, summerize_after_prep, args,
     return eval_xs
 
 def get_train_dataloader(ds, bptt=1000, shuffle=True, num_workers=1, drop_last=True, agg_k_grads=1, not_zs=True):
-        dl = DataLoader(
-            ds, batch_size=bptt, shuffle=shuffle, num_workers=num_workers, drop_last=drop_last,
+        # batches are collated into pinned memory so that the copy to the GPU can be non-blocking
+        loader_kwargs = dict(
+            shuffle=shuffle, num_workers=num_workers, drop_last=drop_last,
+            pin_memory=torch.cuda.is_available(), persistent_workers=num_workers > 0,
         )
-        if len(dl) == 0:
-            ds_len = len(ds)
+        ds_len = len(ds)
+
+        def num_batches(batch_size):
+            # len() of a DataLoader with this batch size
+            return ds_len // batch_size if drop_last else -(-ds_len // batch_size)
+
+        if num_batches(bptt) == 0:
             if not_zs:
                 n_batches = 10
             else:
                 n_batches = 1
             bptt = int(ds_len // n_batches)
-            dl = DataLoader(
-                ds, batch_size=bptt, shuffle=shuffle, num_workers=num_workers, drop_last=drop_last,
-            )
-        while len(dl) % agg_k_grads != 0:
-            bptt += 1
-            dl = DataLoader(
-                ds, batch_size=bptt, shuffle=shuffle, num_workers=num_workers, drop_last=drop_last,
-            )
-            # raise ValueError(f'Number of batches {len(dl)} not divisible by {agg_k_grads}, please modify aggregation factor.')
+        # Find the smallest bptt >= the current one whose number of batches is divisible by agg_k_grads. The number of
+        # batches only changes at a few batch sizes, so jump to the next of those rather than trying bptt + 1.
+        while num_batches(bptt) % agg_k_grads != 0:
+            q = num_batches(bptt)
+            if drop_last:
+                bptt = ds_len // q + 1
+            elif q > 1:
+                bptt = -(-ds_len // (q - 1))
+            else:
+                raise ValueError(f'Cannot split {ds_len} samples into a multiple of {agg_k_grads} batches.')
+        dl = DataLoader(ds, batch_size=bptt, **loader_kwargs)
         return dl, bptt
\ No newline at end of file
@@ -1,4 +1,6 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
 from pathlib import Path
 from datetime import datetime
@@ -6,35 +8,42 @@ import time
 import warnings
 
 import pandas as pd
-import torch
 import wandb
-import uncertainty_metrics.numpy as um
-from sklearn.metrics import (
-    accuracy_score,
-    f1_score,
-    log_loss,
-    roc_auc_score,
-)
+from sklearn.metrics import roc_auc_score
 
 from tunetables.utils import get_wandb_api_key
 from tunetables.scripts import tabular_baselines
 from tunetables.scripts.tabular_baselines import *
 from tunetables.scripts.tabular_evaluation import evaluate
 from tunetables.scripts.tabular_metrics import calculate_score, make_ranks_and_wins_table, make_metric_matrix
+from tunetables.scripts.tabular_metrics import fast_ece, acc_f1, clip_probs, clipped_log_loss
 from tunetables.scripts import tabular_metrics
 from tunetables.scripts.baseline_prediction_interface import baseline_predict
 from tunetables.priors.real import TabularDataset
 from tunetables.priors.real import process_data
 
-def eval_method(splits, device, method, cat_idx, metric_used, max_time=300):
+def r3(x):
+    """rounds a scalar metric to 3 decimals for logging"""
+    return round(float(x), 3)
+
+# calibration metrics are estimated on at most this many rows of a split
+CALIBRATION_MAX_ROWS = 200_000
+
+def _calibration_rows(n, seed=0):
+    """rows used for the calibration metrics: all of them, or a reproducible random subsample for very large splits"""
+    if n <= CALIBRATION_MAX_ROWS:
+        return slice(None)
+    return np.random.default_rng(seed).choice(n, size=CALIBRATION_MAX_ROWS, replace=False)
+
+def eval_method(splits, device, method, cat_idx, metric_used, num_classes, max_time=300):
 
     clf = clf_dict[method]
 
     # def xgb_metric(x, y, test_x, test_y, cat_features, metric_used, max_time=300, no_tune=None, gpu_id=None)
     # def catboost_metric(x, y, test_x, test_y, cat_features, metric_used, max_time=300, no_tune=None, gpu_id=None)
     # return metric, pred, best
-    eval_sets_x = torch.cat([splits[1][0], splits[2][0]])
-    eval_sets_y = torch.cat([splits[1][1], splits[2][1]])
+    eval_sets_x = np.concatenate([splits[1][0], splits[2][0]])
+    eval_sets_y = np.concatenate([splits[1][1], splits[2][1]])
 
     if method in ['random_forest', 'lightgbm', 'autogluon', 'autosklearn2', 'cocktail', 'knn']:
         _, outputs, best_configs = clf(
@@ -55,10 +64,22 @@ def eval_method(splits, device, method, cat_idx, metric_used, max_time=300):
             metric_used,
             gpu_id=device,
         )
-    
-    return outputs, best_configs
+
+    # slice (and copy once to contiguous memory) only if the method returned extra columns
+    outputs = np.asarray(outputs)
+    if outputs.shape[1] != num_classes:
+        outputs = np.ascontiguousarray(outputs[:, 0:num_classes])
+    # argmax and max probability right after prediction, while the outputs are still in cache; they are shared by the
+    # accuracy, F1 and ECE computations
+    predictions = np.argmax(outputs, axis=1)
+    confidences = np.take_along_axis(outputs, predictions[:, None], axis=1)[:, 0]
+
+    return outputs, predictions, confidences, best_configs
 
 def run_eval(dataset_name, base_path, max_time):
+    # imported here so that the module (and --help) loads without it
+    import uncertainty_metrics.numpy as um
+
     print("Running evaluation for dataset: ", dataset_name)
 
     metrics = [tabular_metrics.auc_metric, tabular_metrics.cross_entropy]
@@ -92,34 +113,50 @@ def run_eval(dataset_name, base_path, max_time):
     #     metadata = json.load(f)
 
     dataset = TabularDataset.read(Path(dataset_path).resolve())
+    # With scaler="None", no one-hot encoding and no subsetting, process_data only imputes missing values. When there
+    # are none, the splits are gathered directly from one contiguous copy of the data. The NaN check runs on the
+    # data as read, so the copy is only made when it is used; non-numeric (object) data always goes through process_data.
+    X = np.asarray(dataset.X)
+    if np.issubdtype(X.dtype, np.floating):
+        skip_process_data = not np.isnan(X).any()
+    else:
+        skip_process_data = np.issubdtype(X.dtype, np.number)
+    if skip_process_data:
+        X_all = np.ascontiguousarray(X, dtype=np.float32)
+        y_all = np.ascontiguousarray(dataset.y, dtype=np.int64)
     for i, split_dictionary in enumerate(dataset.split_indeces):
         # TODO: make stopping index a hyperparameter
         train_index = split_dictionary["train"]
         val_index = split_dictionary["val"]
         test_index = split_dictionary["test"]
 
-        # run pre-processing & split data (list of numpy arrays of length num_ensembles)
-        processed_data = process_data(
-            dataset,
-            train_index,
-            val_index,
-            test_index,
-            verbose=False,
-            scaler="None",
-            one_hot_encode=False,
-            args=args,
-        )
-        X_train, y_train = processed_data["data_train"]
-        X_val, y_val = processed_data["data_val"]
-        X_test, y_test = processed_data["data_test"]
-
-        #convert numpy arrays to torch tensors
-        X_train = torch.from_numpy(X_train.astype(np.float32)).float()
-        y_train = torch.from_numpy(y_train.astype(np.int32)).long()
-        X_val = torch.from_numpy(X_val.astype(np.float32)).float()
-        y_val = torch.from_numpy(y_val.astype(np.int32)).long()
-        X_test = torch.from_numpy(X_test.astype(np.float32)).float()
-        y_test = torch.from_numpy(y_test.astype(np.int32)).long()
+        if skip_process_data:
+            X_train, y_train = X_all[train_index], y_all[train_index]
+            X_val, y_val = X_all[val_index], y_all[val_index]
+            X_test, y_test = X_all[test_index], y_all[test_index]
+        else:
+            # run pre-processing & split data (list of numpy arrays of length num_ensembles)
+            processed_data = process_data(
+                dataset,
+                train_index,
+                val_index,
+                test_index,
+                verbose=False,
+                scaler="None",
+                one_hot_encode=False,
+                args=args,
+            )
+            X_train, y_train = processed_data["data_train"]
+            X_val, y_val = processed_data["data_val"]
+            X_test, y_test = processed_data["data_test"]
+
+            # the baselines consume numpy arrays, so there is no need to go through torch tensors
+            X_train = np.ascontiguousarray(X_train, dtype=np.float32)
+            y_train = np.ascontiguousarray(y_train, dtype=np.int64)
+            X_val = np.ascontiguousarray(X_val, dtype=np.float32)
+            y_val = np.ascontiguousarray(y_val, dtype=np.int64)
+            X_test = np.ascontiguousarray(X_test, dtype=np.float32)
+            y_test = np.ascontiguousarray(y_test, dtype=np.int64)
 
         splits = [[X_train, y_train], [X_val, y_val], [X_test, y_test]]
 
@@ -137,10 +174,12 @@ def run_eval(dataset_name, base_path, max_time):
             config['split'] = i
             config['n_configs'] = 100
             model_string = f"{dataset_name}" + '_' + f"{method}" + '_split_' + f"{i}" + '_' + datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
-            wandb.login(key=get_wandb_api_key())
             wandb.init(config=config, name=model_string, group='baselines',
                 project='tt-dp', entity='nyu-dice-lab')
-            num_classes = len(np.unique(y_train))
+            # labels are encoded as 0..C-1, so there is no need to sort them to count the classes
+            assert y_train.min() >= 0
+            num_classes = int(y_train.max()) + 1
+            labels_arr = np.arange(num_classes)
 
             # if num_classes == 2 and method == 'lightgbm':
             #     #convert to 1-class problem
@@ -153,57 +192,69 @@ def run_eval(dataset_name, base_path, max_time):
             results = dict()
             # try:
             start_time = time.time()
-            outputs, best_configs = eval_method(splits, device, method, [], metric_used, max_time=config['max_time'])
+            outputs, predictions, confidences, best_configs = eval_method(splits, device, method, [], metric_used, num_classes, max_time=config['max_time'])
             end_time = time.time()
             run_time = end_time - start_time
-            results[f'Run_Time'] = np.round(run_time, 3).item()
+            results[f'Run_Time'] = r3(run_time)
             # except Exception as e:
             #     print("Error running method: ", e)
             #     wandb.finish()
             #     continue
 
-            outputs = outputs[:, 0:num_classes]
             #numpy softmax
             # outputs = np.exp(outputs) / np.sum(np.exp(outputs), axis=1, keepdims=True)
             # # assert outputs sum to 1
             # assert np.allclose(np.sum(outputs, axis=1), np.ones(outputs.shape[0])), "Outputs do not sum to 1"
 
-            predictions = np.argmax(outputs, axis=1)
+            # clipped copy of the outputs for the log loss; the other metrics use the unclipped outputs
+            clipped_outputs = clip_probs(outputs)
 
             # Divide outputs and predictions into val and test splits
             val_outputs = outputs[:len(y_val)]
             val_predictions = predictions[:len(y_val)]
+            val_confidences = confidences[:len(y_val)]
             test_outputs = outputs[len(y_val):]
             test_predictions = predictions[len(y_val):]
+            test_confidences = confidences[len(y_val):]
+            val_clipped_outputs = clipped_outputs[:len(y_val)]
+            test_clipped_outputs = clipped_outputs[len(y_val):]
 
-            results[f'Val_Accuracy'] = np.round(accuracy_score(y_val, val_predictions), 3).item()
-            results[f'Val_Log_Loss'] = np.round(log_loss(y_val, val_outputs, labels=np.arange(num_classes)), 3).item()
-            results[f'Val_F1_Weighted'] = np.round(f1_score(y_val, val_predictions, average='weighted'), 3).item()
-            results[f'Val_F1_Macro'] = np.round(f1_score(y_val, val_predictions, average='macro'), 3).item()
+            val_acc, val_f1_weighted, val_f1_macro = acc_f1(y_val, val_predictions, num_classes)
+            results[f'Val_Accuracy'] = r3(val_acc)
+            results[f'Val_Log_Loss'] = r3(clipped_log_loss(y_val, val_clipped_outputs))
+            results[f'Val_F1_Weighted'] = r3(val_f1_weighted)
+            results[f'Val_F1_Macro'] = r3(val_f1_macro)
             try:
                 if num_classes == 2:
-                    results['Val_ROC_AUC'] = np.round(roc_auc_score(y_val, val_outputs[:, 1], labels=np.arange(num_classes)), 3).item()
+                    results['Val_ROC_AUC'] = r3(roc_auc_score(y_val, val_outputs[:, 1], labels=labels_arr))
                 else:
-                    results['Val_ROC_AUC'] = np.round(roc_auc_score(y_val, val_outputs, labels=np.arange(num_classes), multi_class='ovr'), 3).item()
+                    # one-vs-rest AUC on a directly built label indicator matrix, instead of multi_class='ovr' re-binarizing y
+                    y_val_bin = (y_val[:, None] == labels_arr[None, :]).view(np.int8)
+                    results['Val_ROC_AUC'] = r3(roc_auc_score(y_val_bin, val_outputs, average='macro'))
             except Exception as e:
                 print("Error calculating ROC AUC: ", e)
                 results['Val_ROC_AUC'] = 0.0
-            results['Val_ECE'] = np.round(um.ece(y_val, val_outputs, num_bins=30), 3).item()
-            results['Val_TACE'] = np.round(um.tace(y_val, val_outputs, num_bins=30), 3).item()
-            results[f'Test_Accuracy'] = np.round(accuracy_score(y_test, test_predictions), 3).item()
-            results[f'Test_Log_Loss'] = np.round(log_loss(y_test, test_outputs, labels=np.arange(num_classes)), 3).item()
-            results[f'Test_F1_Weighted'] = np.round(f1_score(y_test, test_predictions, average='weighted'), 3).item()
-            results[f'Test_F1_Macro'] = np.round(f1_score(y_test, test_predictions, average='macro'), 3).item()
+            cal_idx = _calibration_rows(len(y_val))
+            results['Val_ECE'] = r3(fast_ece(y_val[cal_idx], val_confidences[cal_idx], val_predictions[cal_idx], num_bins=30))
+            results['Val_TACE'] = r3(um.tace(y_val[cal_idx], val_outputs[cal_idx], num_bins=30))
+            test_acc, test_f1_weighted, test_f1_macro = acc_f1(y_test, test_predictions, num_classes)
+            results[f'Test_Accuracy'] = r3(test_acc)
+            results[f'Test_Log_Loss'] = r3(clipped_log_loss(y_test, test_clipped_outputs))
+            results[f'Test_F1_Weighted'] = r3(test_f1_weighted)
+            results[f'Test_F1_Macro'] = r3(test_f1_macro)
             try:
                 if num_classes == 2:
-                    results['Test_ROC_AUC'] = np.round(roc_auc_score(y_test, test_outputs[:, 1], labels=np.arange(num_classes)), 3).item()
+                    results['Test_ROC_AUC'] = r3(roc_auc_score(y_test, test_outputs[:, 1], labels=labels_arr))
                 else:
-                    results['Test_ROC_AUC'] = np.round(roc_auc_score(y_test, test_outputs, labels=np.arange(num_classes), multi_class='ovr'), 3).item()
+                    # one-vs-rest AUC on a directly built label indicator matrix, instead of multi_class='ovr' re-binarizing y
+                    y_test_bin = (y_test[:, None] == labels_arr[None, :]).view(np.int8)
+                    results['Test_ROC_AUC'] = r3(roc_auc_score(y_test_bin, test_outputs, average='macro'))
             except Exception as e:
                 print("Error calculating ROC AUC: ", e)
                 results['Test_ROC_AUC'] = 0.0
-            results['Test_ECE'] = np.round(um.ece(y_test, test_outputs, num_bins=30), 3).item()
-            results['Test_TACE'] = np.round(um.tace(y_test, test_outputs, num_bins=30), 3).item()
+            cal_idx = _calibration_rows(len(y_test))
+            results['Test_ECE'] = r3(fast_ece(y_test[cal_idx], test_confidences[cal_idx], test_predictions[cal_idx], num_bins=30))
+            results['Test_TACE'] = r3(um.tace(y_test[cal_idx], test_outputs[cal_idx], num_bins=30))
             if isinstance(best_configs, pd.DataFrame) or isinstance(best_configs, pd.Series):
                 save_path = os.path.join(base_path, model_string + ".csv")
                 best_configs.to_csv(save_path)
@@ -222,11 +273,20 @@ if __name__ == '__main__':
     parser.add_argument('--dataset_path', type=str, default='./tunetables/data')
     parser.add_argument('--datasets', type=str, default='./tunetables/metadata/subset.txt', help='Path to datasets text file')
     parser.add_argument('--max_time', type=int, default=300, help='Allowed run time (in seconds)')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Number of datasets evaluated in parallel')
 
     args = parser.parse_args()
 
+    # log in once; every (dataset, split, method) run only calls wandb.init / wandb.finish
+    wandb.login(key=get_wandb_api_key())
+
     with open(args.datasets) as f:
-        datasets = f.readlines()
-    for dataset in datasets:
-        dataset = dataset.strip()
-        run_eval(dataset, args.dataset_path, args.max_time)
\ No newline at end of file
+        datasets = (line.strip() for line in f)
+        datasets = (dataset for dataset in datasets if dataset)
+        if args.n_jobs > 1:
+            # datasets are independent runs; the baselines themselves already use all cores, so keep n_jobs small
+            with ProcessPoolExecutor(max_workers=args.n_jobs) as executor:
+                list(executor.map(partial(run_eval, base_path=args.dataset_path, max_time=args.max_time), datasets))
+        else:
+            for dataset in datasets:
+                run_eval(dataset, args.dataset_path, args.max_time)
\ No newline at end of file
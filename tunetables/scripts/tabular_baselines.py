@@ -211,6 +211,12 @@ def eval_complete_f(x, y, test_x, test_y, key, clf_, metric_used, max_time, no_t
 
     return metric, pred, best#, times
 
+def to_numpy(x, dtype=None):
+    """returns x as a numpy array; accepts torch tensors and array-likes"""
+    if torch.is_tensor(x):
+        x = x.cpu().numpy()
+    return np.asarray(x, dtype=dtype)
+
 def preprocess_impute(x, y, test_x, test_y, impute, one_hot, standardize, cat_features=[]):
     import warnings
     def warn(*args, **kwargs):
@@ -218,7 +224,7 @@ def preprocess_impute(x, y, test_x, test_y, impute, one_hot, standardize, cat_fe
 
     warnings.warn = warn
 
-    x, y, test_x, test_y = x.cpu().numpy(), y.cpu().long().numpy(), test_x.cpu().numpy(), test_y.cpu().long().numpy()
+    x, y, test_x, test_y = to_numpy(x), to_numpy(y, np.int64), to_numpy(test_x), to_numpy(test_y, np.int64)
 
     if impute:
         imp_mean = SimpleImputer(missing_values=np.nan, strategy='mean')
@@ -748,7 +754,7 @@ def well_tuned_simple_nets_metric(X_train, y_train, X_test, y_test, categorical_
 
         start_time = time.time()
 
-        X_train, y_train, X_test, y_test = X_train.cpu().numpy(), y_train.cpu().long().numpy(), X_test.cpu().numpy(), y_test.cpu().long().numpy()
+        X_train, y_train, X_test, y_test = to_numpy(X_train), to_numpy(y_train, np.int64), to_numpy(X_test), to_numpy(y_test, np.int64)
 
         def safe_int(x):
             assert np.all(x.astype('int64') == x) or np.any(x != x), np.unique(x) # second condition for ignoring nans
@@ -1355,7 +1361,7 @@ def ridge_metric(x, y, test_x, test_y, cat_features, metric_used):
 
     warnings.warn = warn
 
-    x, y, test_x, test_y = x.cpu(), y.cpu(), test_x.cpu(), test_y.cpu()
+    x, y, test_x, test_y = torch.as_tensor(x).cpu(), torch.as_tensor(y).cpu(), torch.as_tensor(test_x).cpu(), torch.as_tensor(test_y).cpu()
     x, test_x = torch.nan_to_num(x), torch.nan_to_num(test_x)
 
     clf = RidgeClassifier(n_jobs=MULTITHREAD)
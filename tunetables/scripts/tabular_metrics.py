@@ -8,6 +8,8 @@ Includes a few metric as well as functions composing metrics on results files.
 
 
 
+from functools import lru_cache
+
 import numpy as np
 import torch
 from sklearn.metrics import roc_auc_score, accuracy_score, balanced_accuracy_score, average_precision_score, mean_squared_error, mean_absolute_error, r2_score
@@ -127,6 +129,90 @@ def count_metric(x, y):
     """
     return 1
 
+@lru_cache(maxsize=None)
+def _ece_kernel():
+    """compile the numba ECE kernel on first use, so that importing this module does not import numba; None when
+    numba is not installed"""
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(cache=True)
+    def ece_kernel(conf, correct, bin_upper_bounds):
+        """per-bin sums of confidences and correct predictions in a single pass, binned like np.digitize. Runs
+        sequentially: a prange loop would race on the shared bin accumulators."""
+        M = bin_upper_bounds.shape[0]
+        sum_conf = np.zeros(M + 1)
+        sum_acc = np.zeros(M + 1)
+        n = 0
+        for i in range(conf.shape[0]):
+            c = conf[i]
+            # um.ece ignores zero confidences
+            if not c > 0:
+                continue
+            b = min(int(c * M), M)
+            # correct the estimate so that bin_upper_bounds[b - 1] <= c < bin_upper_bounds[b]
+            while b < M and bin_upper_bounds[b] <= c:
+                b += 1
+            while b > 0 and bin_upper_bounds[b - 1] > c:
+                b -= 1
+            sum_conf[b] += c
+            if correct[i]:
+                sum_acc[b] += 1.0
+            n += 1
+        return sum_conf, sum_acc, n
+
+    return ece_kernel
+
+def fast_ece(labels, conf, pred, num_bins=30):
+    """expected calibration error over even bins of the max probability; same result as um.ece, with the per-bin
+    sums computed by np.bincount. conf and pred are the max probability and the argmax of each row"""
+    correct = pred == np.asarray(labels)
+    # same bin edges as um.ece; a confidence of exactly 1 gets its own bin
+    bin_upper_bounds = np.histogram_bin_edges([], bins=num_bins, range=(0.0, 1.0))[1:]
+    ece_kernel = _ece_kernel()
+    if ece_kernel is not None:
+        sum_conf, sum_acc, n = ece_kernel(conf, correct, bin_upper_bounds)
+    else:
+        # um.ece ignores zero confidences
+        keep = conf > 0
+        conf, correct = conf[keep], correct[keep]
+        bins = np.digitize(conf, bin_upper_bounds)
+        sum_conf = np.bincount(bins, weights=conf, minlength=num_bins + 1)
+        sum_acc = np.bincount(bins, weights=correct, minlength=num_bins + 1)
+        n = conf.size
+    if n == 0:
+        return 0.
+    return np.abs(sum_acc - sum_conf).sum() / n
+
+def acc_f1(y, y_pred, num_classes):
+    """accuracy, weighted F1 and macro F1 from a single confusion matrix; same results as the sklearn metrics"""
+    cm = np.bincount(y * num_classes + y_pred, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    pred_pos = cm.sum(axis=0)
+    denom = support + pred_pos
+    f1 = np.divide(2 * tp, denom, out=np.zeros(num_classes), where=denom > 0)
+    acc = tp.sum() / cm.sum()
+    f1_weighted = (f1 * support).sum() / support.sum()
+    # sklearn averages over the labels present in y or y_pred
+    f1_macro = f1[denom > 0].mean()
+    return acc, f1_weighted, f1_macro
+
+def clip_probs(probs):
+    """clips probabilities the way sklearn's log_loss does, so that it can be done once for the val and test splits"""
+    if probs.dtype not in (np.float16, np.float32, np.float64):
+        probs = probs.astype(np.float64)
+    eps = np.finfo(probs.dtype).eps
+    return np.clip(probs, eps, 1 - eps)
+
+def clipped_log_loss(y, clipped_probs):
+    """log loss of probabilities already clipped by clip_probs; same result as sklearn's log_loss with all labels,
+    but gathers the true-class probability of each row instead of multiplying with a one-hot label matrix"""
+    p_true = np.take_along_axis(clipped_probs, y[:, None], axis=1)[:, 0] / clipped_probs.sum(axis=1)
+    return -np.log(p_true).mean()
+
 """
 ===============================
 Metrics composition
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from tunetables.priors.real import CoresetSampler
+
+
+def brute_force_coreset(features, start_points, k):
+    # farthest-point traversal seeded with the starting points
+    dist = ((features[:, None] - features[start_points][None]) ** 2).sum(-1).min(1)
+    indices = list(start_points[:k])
+    for _ in range(k - len(indices)):
+        idx = int(dist.argmax())
+        indices.append(idx)
+        dist = np.minimum(dist, ((features - features[idx]) ** 2).sum(-1))
+    return np.array(indices)
+
+
+class TestCoresetSampler(unittest.TestCase):
+    def test_starting_points_lead_the_coreset(self):
+        X = np.random.default_rng(0).normal(size=(500, 8))
+        indices = CoresetSampler(40, 5, 0)._compute_greedy_coreset_indices(X)
+        start_points = np.random.default_rng(0).choice(len(X), 5, replace=False)
+        self.assertEqual(len(indices), 40)
+        np.testing.assert_array_equal(indices[:5], start_points)
+        self.assertEqual(len(np.unique(indices)), 40)
+        np.testing.assert_array_equal(indices, brute_force_coreset(X, start_points, 40))
+
+    def test_more_points_than_rows_covers_every_row(self):
+        X = np.random.default_rng(1).normal(size=(10, 3))
+        indices = CoresetSampler(15, 5, 0)._compute_greedy_coreset_indices(X)
+        self.assertEqual(len(indices), 15)
+        self.assertEqual(set(indices.tolist()), set(range(10)))
+
+    def test_fewer_points_than_starting_points(self):
+        X = np.random.default_rng(2).normal(size=(50, 3))
+        indices = CoresetSampler(3, 5, 0)._compute_greedy_coreset_indices(X)
+        start_points = np.random.default_rng(0).choice(len(X), 5, replace=False)
+        np.testing.assert_array_equal(indices, start_points[:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from tunetables.priors import real
+from tunetables.priors.real import TabularDataset, read_compressed, write_compressed
+
+
+def make_dataset(X=None):
+    rng = np.random.default_rng(0)
+    if X is None:
+        X = rng.normal(size=(50, 4))
+    y = rng.integers(0, 3, size=X.shape[0])
+    split_indeces = [{"train": np.arange(30), "val": np.arange(30, 40), "test": np.arange(40, 50)}]
+    return TabularDataset("test", X, y, [], "classification", 3, split_indeces=split_indeces)
+
+
+class TestCompressedArrays(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_round_trip(self, arr, name):
+        write_compressed(self.dir / name, arr)
+        out = read_compressed(self.dir / name)
+        self.assertEqual(out.dtype, arr.dtype)
+        np.testing.assert_array_equal(out, arr)
+
+    def test_gzip(self):
+        arr = np.random.default_rng(0).normal(size=(100, 7)).astype(np.float32)
+        self.assert_round_trip(arr, "a.npy.gz")
+        self.assert_round_trip(np.empty((0, 7)), "empty.npy.gz")
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_blosc(self):
+        rng = np.random.default_rng(0)
+        self.assert_round_trip(rng.normal(size=(100, 7)), "a.npy.blosc")
+        self.assert_round_trip(rng.integers(0, 10, size=333), "ints.npy.blosc")
+        self.assert_round_trip(np.empty((0, 7), dtype=np.float32), "empty.npy.blosc")
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_blosc_multiple_frames(self):
+        arr = np.random.default_rng(0).normal(size=(101, 3))
+        # 64 bytes per frame -> 8 float64 per frame, the last frame is partial
+        with mock.patch.object(real, "BLOSC_FRAME_SIZE", 64):
+            write_compressed(self.dir / "a.npy.blosc", arr)
+        with open(self.dir / "a.npy.blosc", "rb") as f:
+            header = real.json.loads(f.read(int.from_bytes(f.read(4), "little")))
+        self.assertEqual(header["frame_items"], 8)
+        self.assertEqual(len(header["frames"]), -(-arr.size // 8))
+        np.testing.assert_array_equal(read_compressed(self.dir / "a.npy.blosc"), arr)
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_blosc_rejects_object_arrays(self):
+        with self.assertRaises(ValueError):
+            write_compressed(self.dir / "a.npy.blosc", np.array(["a", None], dtype=object))
+
+
+class TestTabularDatasetIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name) / "dataset"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_same_dataset(self, a, b):
+        np.testing.assert_array_equal(a.X, b.X)
+        np.testing.assert_array_equal(a.y, b.y)
+        self.assertEqual(a.get_metadata(), b.get_metadata())
+        np.testing.assert_array_equal(a.split_indeces[0]["test"], b.split_indeces[0]["test"])
+
+    def test_gzip_round_trip(self):
+        dataset = make_dataset()
+        dataset.write(self.dir)
+        self.assert_same_dataset(TabularDataset.read(self.dir), dataset)
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_blosc_round_trip_removes_stale_gzip(self):
+        dataset = make_dataset()
+        dataset.write(self.dir)
+        dataset.write(self.dir, overwrite=True, compression="blosc")
+        self.assertTrue((self.dir / "X.npy.blosc").exists())
+        self.assertFalse((self.dir / "X.npy.gz").exists())
+        self.assertFalse((self.dir / "y.npy.gz").exists())
+        self.assert_same_dataset(TabularDataset.read(self.dir), dataset)
+
+        # and back: the blosc files must not shadow the new gzip ones
+        dataset.write(self.dir, overwrite=True)
+        self.assertFalse((self.dir / "X.npy.blosc").exists())
+        self.assertTrue((self.dir / "X.npy.gz").exists())
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_blosc_without_numcodecs(self):
+        make_dataset().write(self.dir, compression="blosc")
+        with mock.patch.object(real, "Blosc", None):
+            with self.assertRaisesRegex(ImportError, "numcodecs"):
+                TabularDataset.read(self.dir)
+            with self.assertRaisesRegex(ImportError, "numcodecs"):
+                TabularDataset.decompress_cache(self.dir)
+
+    @unittest.skipIf(real.Blosc is None, "numcodecs is not installed")
+    def test_object_arrays_fall_back_to_gzip(self):
+        X = np.array([["a", 1.0], ["b", np.nan]] * 25, dtype=object)
+        dataset = make_dataset(X)
+        dataset.write(self.dir, compression="blosc")
+        self.assertTrue((self.dir / "X.npy.gz").exists())
+        self.assertTrue((self.dir / "y.npy.blosc").exists())
+        read = TabularDataset.read(self.dir)
+        self.assertEqual(read.X.dtype, object)
+        self.assertEqual(read.X[0, 0], "a")
+
+    def test_mmap_cache(self):
+        dataset = make_dataset()
+        dataset.write(self.dir)
+        TabularDataset.decompress_cache(self.dir)
+        self.assertTrue((self.dir / "X.npy").exists())
+        read = TabularDataset.read(self.dir, mmap=True)
+        self.assertIsInstance(read.X, np.memmap)
+        self.assert_same_dataset(read, dataset)
+
+        # copy-on-write: changing the loaded array leaves the cache file untouched
+        read.X[0, 0] = 123.0
+        np.testing.assert_array_equal(np.load(self.dir / "X.npy"), dataset.X)
+
+        # rewriting the dataset drops the now stale cache
+        dataset.write(self.dir, overwrite=True)
+        self.assertFalse((self.dir / "X.npy").exists())
+        self.assertNotIsInstance(TabularDataset.read(self.dir, mmap=True).X, np.memmap)
+
+    def test_mmap_cache_skips_object_arrays(self):
+        X = np.array([["a", 1.0], ["b", np.nan]] * 25, dtype=object)
+        make_dataset(X).write(self.dir)
+        TabularDataset.decompress_cache(self.dir)
+        self.assertFalse((self.dir / "X.npy").exists())
+        self.assertTrue((self.dir / "y.npy").exists())
+        self.assertEqual(TabularDataset.read(self.dir, mmap=True).X.dtype, object)
+
+
+if __name__ == '__main__':
+    unittest.main()
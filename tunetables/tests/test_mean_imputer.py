@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+from sklearn.impute import SimpleImputer
+
+from tunetables.priors.real import MeanImputer
+
+
+def with_nans(rng, shape, dtype, frac=0.2):
+    X = rng.normal(size=shape).astype(dtype)
+    X[rng.random(shape) < frac] = np.nan
+    # keep at least one value per column, SimpleImputer drops fully NaN columns
+    X[0] = rng.normal(size=shape[1])
+    return X
+
+
+class TestMeanImputer(unittest.TestCase):
+    def assert_matches_simple_imputer(self, X_fit, X_transform):
+        expected = SimpleImputer(strategy="mean").fit(X_fit).transform(X_transform)
+        X_transform_before = X_transform.copy()
+        out = MeanImputer().fit(X_fit).transform(X_transform)
+        self.assertEqual(out.dtype, expected.dtype)
+        np.testing.assert_allclose(out, expected, rtol=1e-6 if out.dtype == np.float32 else 1e-12)
+        # the input is not imputed in place
+        np.testing.assert_array_equal(X_transform, X_transform_before)
+
+    def test_matches_simple_imputer(self):
+        rng = np.random.default_rng(0)
+        for dtype in [np.float32, np.float64]:
+            X = with_nans(rng, (300, 6), dtype)
+            self.assert_matches_simple_imputer(X, X)
+            # statistics from the fit data are used for new data
+            self.assert_matches_simple_imputer(X[:200], with_nans(rng, (100, 6), dtype, frac=0.5))
+
+    def test_no_missing_values(self):
+        X = np.random.default_rng(1).normal(size=(50, 3))
+        self.assert_matches_simple_imputer(X, X)
+
+    def test_int_input(self):
+        X = np.random.default_rng(2).integers(0, 10, size=(50, 3))
+        self.assert_matches_simple_imputer(X, X)
+
+
+if __name__ == '__main__':
+    unittest.main()
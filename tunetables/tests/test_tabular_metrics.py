@@ -0,0 +1,108 @@
+import unittest
+import warnings
+from unittest import mock
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score, log_loss
+
+from tunetables.scripts import tabular_metrics
+
+try:
+    from uncertainty_metrics.numpy.general_calibration_error import ece as reference_ece
+except ImportError:
+    reference_ece = None
+
+
+def random_probs(rng, n, num_classes, dtype):
+    probs = rng.dirichlet(np.ones(num_classes) * 0.5, size=n)
+    # ties, one-hot rows, values on the bin edges and all-zero (zero confidence) rows
+    probs[0:5] = 1. / num_classes
+    probs[5:10] = np.eye(num_classes)[rng.integers(0, num_classes, 5)]
+    probs[10:15, :] = 0.
+    probs[10:15, 0] = np.arange(1, 6) / 30
+    probs[10:15, 1] = 1 - probs[10:15, 0]
+    probs[15:18] = 0.
+    return probs.astype(dtype)
+
+
+class TestFastEce(unittest.TestCase):
+    @unittest.skipIf(reference_ece is None, "uncertainty_metrics is not installed")
+    def test_matches_uncertainty_metrics(self):
+        rng = np.random.default_rng(0)
+        # the numba kernel (when installed) and the NumPy fallback
+        for kernel in [tabular_metrics._ece_kernel(), None]:
+            with mock.patch.object(tabular_metrics, "_ece_kernel", return_value=kernel):
+                for dtype in [np.float32, np.float64]:
+                    for num_classes in [2, 5]:
+                        probs = random_probs(rng, 1000, num_classes, dtype)
+                        labels = rng.integers(0, num_classes, size=len(probs))
+                        pred = probs.argmax(axis=1)
+                        conf = np.take_along_axis(probs, pred[:, None], axis=1)[:, 0]
+                        self.assertAlmostEqual(
+                            tabular_metrics.fast_ece(labels, conf, pred, num_bins=30),
+                            reference_ece(labels, probs, num_bins=30),
+                            places=12,
+                        )
+
+    def test_all_zero_confidences(self):
+        for kernel in [tabular_metrics._ece_kernel(), None]:
+            with mock.patch.object(tabular_metrics, "_ece_kernel", return_value=kernel):
+                self.assertEqual(tabular_metrics.fast_ece(np.zeros(3, dtype=int), np.zeros(3), np.zeros(3, dtype=int)), 0.)
+
+
+class TestAccF1(unittest.TestCase):
+    def assert_matches_sklearn(self, y, y_pred, num_classes):
+        acc, f1_weighted, f1_macro = tabular_metrics.acc_f1(y, y_pred, num_classes)
+        self.assertAlmostEqual(acc, accuracy_score(y, y_pred), places=12)
+        self.assertAlmostEqual(f1_weighted, f1_score(y, y_pred, average='weighted', zero_division=0), places=12)
+        self.assertAlmostEqual(f1_macro, f1_score(y, y_pred, average='macro', zero_division=0), places=12)
+
+    def test_matches_sklearn(self):
+        rng = np.random.default_rng(0)
+        for num_classes in [2, 3, 6]:
+            y = rng.integers(0, num_classes, size=500)
+            y_pred = np.where(rng.random(500) < 0.7, y, rng.integers(0, num_classes, size=500))
+            self.assert_matches_sklearn(y, y_pred, num_classes)
+
+    def test_missing_classes(self):
+        y = np.array([0, 0, 1, 1, 2, 2, 2])
+        # class 2 is never predicted
+        self.assert_matches_sklearn(y, np.array([0, 1, 1, 1, 0, 1, 0]), 3)
+        # class 3 is predicted but never true, class 4 is neither
+        self.assert_matches_sklearn(y, np.array([0, 3, 1, 1, 2, 3, 2]), 5)
+        # a single predicted class
+        self.assert_matches_sklearn(y, np.zeros_like(y), 3)
+
+
+class TestClippedLogLoss(unittest.TestCase):
+    def test_matches_sklearn(self):
+        rng = np.random.default_rng(0)
+        for dtype, rtol in [(np.float32, 1e-6), (np.float64, 1e-12)]:
+            for num_classes in [2, 4]:
+                probs = random_probs(rng, 1000, num_classes, dtype)
+                # rows that do not sum to one are renormalized by both
+                probs[20:25] *= 1.5
+                y = rng.integers(0, num_classes, size=len(probs))
+                # class 0 never occurs in y
+                y[y == 0] = 1
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    expected = log_loss(y, probs, labels=np.arange(num_classes))
+                clipped = tabular_metrics.clip_probs(probs)
+                self.assertEqual(clipped.dtype, dtype)
+                np.testing.assert_allclose(tabular_metrics.clipped_log_loss(y, clipped), expected, rtol=rtol)
+
+    def test_split_rows_share_the_clipping(self):
+        rng = np.random.default_rng(1)
+        probs = random_probs(rng, 200, 3, np.float64)
+        y = rng.integers(0, 3, size=200)
+        clipped = tabular_metrics.clip_probs(probs)
+        np.testing.assert_allclose(
+            tabular_metrics.clipped_log_loss(y[:50], clipped[:50]),
+            log_loss(y[:50], probs[:50], labels=np.arange(3)),
+            rtol=1e-12,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
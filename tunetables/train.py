@@ -679,7 +679,7 @@ def train(args, dataset, criterion, encoder_generator, emsize=200, nhid=200, nla
                         #print(" Data shape: ", data[0].shape, "Targets shape: ", data[1].shape, "Single eval pos: ", single_eval_pos)
 
                     # If style is set to None, it should not be transferred to device
-                    output = e_model(tuple(e.to(torch.float32).to(device) if torch.is_tensor(e) else e for e in data) if isinstance(data, tuple) else data.to(device)
+                    output = e_model(tuple(e.to(torch.float32).to(device, non_blocking=True) if torch.is_tensor(e) else e for e in data) if isinstance(data, tuple) else data.to(device, non_blocking=True)
                                    , single_eval_pos=single_eval_pos)
                     
                     # if batch_size > 1:
@@ -696,11 +696,11 @@ def train(args, dataset, criterion, encoder_generator, emsize=200, nhid=200, nla
                             'need to write a little bit of code to handle multiple regression targets at once'
                         mean_pred = output[..., 0]
                         var_pred = output[..., 1].abs()
-                        losses = criterion(mean_pred.flatten(), targets.to(device).flatten(), var=var_pred.flatten())
+                        losses = criterion(mean_pred.flatten(), targets.to(device, non_blocking=True).flatten(), var=var_pred.flatten())
                     elif isinstance(criterion, (nn.MSELoss, nn.BCEWithLogitsLoss)):
-                        losses = criterion(output.flatten(), targets.to(device).flatten())
+                        losses = criterion(output.flatten(), targets.to(device, non_blocking=True).flatten())
                     elif isinstance(criterion, nn.CrossEntropyLoss):
-                        losses = criterion(output.reshape(-1, n_out), targets.to(device).long().flatten())
+                        losses = criterion(output.reshape(-1, n_out), targets.to(device, non_blocking=True).long().flatten())
                     elif do_kl_loss:
                         #TODO: investigate shape mismatches
                         real_data_preds = eval_model.predict_proba(data[0])